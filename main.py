@@ -1,29 +1,47 @@
 import argparse
 import asyncio
+import importlib.util
 import json
 import re
 import subprocess
 import zipfile
 import shutil
+import struct
 import threading
 import sys
 import os
+import queue
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
 # Dependency Check
 try:
+    import anyio
     import httpx
+    import numpy as np
+    import orjson
+    import cv2
+    import piexif
     from PIL import Image
-    from pydantic import BaseModel, Field, field_validator
+    from pydantic import BaseModel, Field, PrivateAttr, field_validator, model_validator
     from tqdm.auto import tqdm 
     import ffmpeg
+    # http2=True needs h2 (installed by httpx[http2]); httpx only imports it lazily
+    if importlib.util.find_spec("h2") is None: raise ImportError("No module named 'h2'")
 except ImportError as e:
     print(f"Critical Dependency Missing: {e}")
     print("Please run: pip install -r requirements.txt")
     sys.exit(1)
 
+# Optional: libjpeg-turbo SIMD encoder (needs the native turbojpeg library)
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+    TURBO_JPEG = TurboJPEG()
+except Exception:
+    TURBO_JPEG = None
+
 # ======================================================
 # CONFIGURATION
 # ======================================================
@@ -32,12 +50,30 @@ DOWNLOAD_SEM = asyncio.Semaphore(10) # Default safe limit
 BAR_LOCK = threading.Lock()
 FILE_LOCK = threading.Lock() 
 FAILED_LOG = "failed_memories.json"
+FAILED_JOURNAL = FAILED_LOG + "l" # Append-only during a run, compacted into FAILED_LOG at the end
+FAILED_SEEN = set()
 FFMPEG_TIMEOUT = 300 
+DOWNLOAD_CHUNK = 64 * 1024
+SCAN_WORKERS = 32
+EXIFTOOL_TIMEOUT = 10 # Seconds per file
+GPU_LOCK = threading.Lock()
+NVENC_SESSIONS = 3 # Consumer GPUs reject extra concurrent encoders
+MERGE_BATCH = 8 # Clips per FFmpeg process
+MERGE_BATCH_DELAY = 2 # Seconds to wait for a batch to fill
+VIDEO_BATCHER = None
+GPU_FAIL_LIMIT = 3 # Consecutive GPU-only failures before giving up on the GPU
+GPU_FAIL_STREAK = 0
 
 ERROR_COUNT = 0 
 USE_GPU = False 
 PROCESSING_MODE = 1  # Default to Keep Both
 
+VIDEO_COST = 2 # Relative expected latency, used to order the work queue
+IMAGE_COST = 1
+
+RAW_SUFFIXES = ("_MAIN.mp4", "_MAIN.jpg", "_MAIN.png")
+MERGED_SUFFIXES = ("_MERGED.mp4", "_MERGED.jpg")
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
     "Accept": "*/*",
@@ -48,6 +84,20 @@ HEADERS = {
 # DATA MODELS
 # ======================================================
 
+# Snapchat export format ("2023-05-01 12:34:56 UTC"); parsed without strptime
+DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?: UTC)?$")
+DATE_FORMATS = ["%Y-%m-%d %H:%M:%S UTC", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S %Z"]
+
+def parse_date_str(v: str) -> datetime:
+    m = DATE_RE.match(v)
+    if m: return datetime(*map(int, m.groups()))
+    try: return datetime.fromisoformat(v)
+    except ValueError: pass
+    for fmt in DATE_FORMATS:
+        try: return datetime.strptime(v, fmt)
+        except ValueError: continue
+    raise ValueError(f"Unknown date format: {v}")
+
 class Memory(BaseModel):
     date: datetime = Field(alias="Date")
     media_url: str | None = Field(default=None, alias="Media Download Url")
@@ -61,18 +111,27 @@ class Memory(BaseModel):
     @classmethod
     def parse_date(cls, v):
         if not isinstance(v, str): return v
-        v = v.strip()
-        try: return datetime.fromisoformat(v)
-        except ValueError: pass
-        formats = ["%Y-%m-%d %H:%M:%S UTC", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M:%S %Z"]
-        for fmt in formats:
-            try: return datetime.strptime(v, fmt)
-            except ValueError: continue
-        raise ValueError(f"Unknown date format: {v}")
+        return parse_date_str(v.strip())
+
+    _filename: str = PrivateAttr(default="")
+
+    @model_validator(mode="after")
+    def cache_filename(self):
+        self._filename = self.date.strftime("%Y-%m-%d_%H-%M-%S")
+        return self
 
     @property
     def filename(self):
-        return self.date.strftime("%Y-%m-%d_%H-%M-%S")
+        return self._filename
+
+    def candidate_names(self, mode):
+        """Existing-output names to look for, in preference order.
+        Mode 3: Only MAIN. Mode 1/2: MERGED first, then MAIN."""
+        suffixes = RAW_SUFFIXES if mode == 3 else MERGED_SUFFIXES + RAW_SUFFIXES
+        return tuple(f"{self._filename}{sfx}" for sfx in suffixes)
+
+    def candidate_paths(self, outdir: Path, mode):
+        return tuple(outdir / n for n in self.candidate_names(mode))
 
 # ======================================================
 # UTILITIES
@@ -80,6 +139,14 @@ class Memory(BaseModel):
 
 def is_img(p): return p.suffix.lower() in (".jpg", ".jpeg", ".png")
 
+def is_zip(p, magic=None):
+    """Checks the 4-byte signature instead of scanning for the end-of-central-directory record."""
+    if magic is None:
+        with open(p, "rb") as f: magic = f.read(4)
+    if magic == b"PK\x03\x04": return True
+    # Other PK records (empty/spanned archives) are rare; let zipfile decide those
+    return magic[:2] == b"PK" and zipfile.is_zipfile(p)
+
 def clean_debris(outdir: Path):
     """Removes temporary files from previous incomplete runs."""
     for p in outdir.glob("*_zip"):
@@ -89,24 +156,48 @@ def clean_debris(outdir: Path):
     for p in outdir.glob("*.zip"):
         if p.is_file(): p.unlink(missing_ok=True)
 
+def read_failures():
+    """Returns logged failures from the compacted JSON plus any pending journal lines."""
+    data = []
+    if os.path.exists(FAILED_LOG):
+        try:
+            with open(FAILED_LOG, "rb") as f: data = orjson.loads(f.read())
+        except: data = []
+    if os.path.exists(FAILED_JOURNAL):
+        with open(FAILED_JOURNAL, "rb") as f:
+            for line in f:
+                try: data.append(orjson.loads(line))
+                except: continue
+    return data
+
+def load_failure_log():
+    """Seeds the duplicate filter with failures recorded by previous runs."""
+    FAILED_SEEN.update(d.get("Media Download Url") for d in read_failures())
+
 def log_failure(mem: Memory, error_msg: str):
     entry = mem.model_dump(by_alias=True)
     entry["Date"] = mem.date.strftime("%Y-%m-%d %H:%M:%S UTC")
     entry["_error"] = str(error_msg)
 
     with FILE_LOCK:
-        data = []
-        if os.path.exists(FAILED_LOG):
-            try:
-                with open(FAILED_LOG, "r", encoding="utf-8") as f: data = json.load(f)
-            except: data = []
-        
         # Avoid duplicate entries
-        if not any(d.get("Media Download Url") == entry["Media Download Url"] for d in data):
-            data.append(entry)
-            
+        if entry["Media Download Url"] in FAILED_SEEN: return
+        FAILED_SEEN.add(entry["Media Download Url"])
+        with open(FAILED_JOURNAL, "ab") as f: f.write(orjson.dumps(entry) + b"\n")
+
+def compact_failure_log():
+    """Folds the append-only journal into the human-readable failed_memories.json."""
+    with FILE_LOCK:
+        if not os.path.exists(FAILED_JOURNAL): return
+        data, seen = [], set()
+        for d in read_failures():
+            url = d.get("Media Download Url")
+            if url in seen: continue
+            seen.add(url); data.append(d)
+
         with open(FAILED_LOG, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
+        os.remove(FAILED_JOURNAL)
 
 def safe_write(path, data):
     try:
@@ -134,6 +225,114 @@ def verify_file_integrity(path):
 # MEDIA PROCESSING
 # ======================================================
 
+MP4_CONTAINERS = (b"moov", b"trak", b"mdia")
+MP4_TIME_BOXES = (b"mvhd", b"tkhd", b"mdhd")
+MP4_EPOCH = datetime(1904, 1, 1)
+
+def _patch_mp4_boxes(f, start, end, secs):
+    """Rewrites creation/modification times of header boxes in place. Returns boxes patched."""
+    patched, pos = 0, start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1: size, header = struct.unpack(">Q", f.read(8))[0], 16
+        elif size == 0: size = end - pos
+        if size < header: break
+
+        if kind in MP4_CONTAINERS:
+            patched += _patch_mp4_boxes(f, pos + header, pos + size, secs)
+        elif kind in MP4_TIME_BOXES:
+            f.seek(pos + header)
+            version = f.read(1)[0]
+            f.seek(3, os.SEEK_CUR) # flags
+            f.write(struct.pack(">QQ", secs, secs) if version == 1 else struct.pack(">II", secs, secs))
+            patched += 1
+        pos += size
+    return patched
+
+def write_video_dates(path, date: datetime):
+    """Sets CreateDate/ModifyDate/TrackCreateDate/MediaCreateDate without spawning exiftool."""
+    if date.tzinfo: date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    secs = int((date - MP4_EPOCH).total_seconds())
+    with open(path, "r+b") as f:
+        return _patch_mp4_boxes(f, 0, os.fstat(f.fileno()).st_size, secs) > 0
+
+def write_image_dates(path, ts: str):
+    """Sets DateTimeOriginal/CreateDate/ModifyDate, keeping any existing EXIF tags."""
+    if path.suffix.lower() not in (".jpg", ".jpeg"): return False
+    exif = piexif.load(str(path))
+    exif["0th"][piexif.ImageIFD.DateTime] = ts.encode()
+    exif["Exif"][piexif.ExifIFD.DateTimeOriginal] = ts.encode()
+    exif["Exif"][piexif.ExifIFD.DateTimeDigitized] = ts.encode()
+    piexif.insert(piexif.dump(exif), str(path))
+    return True
+
+class ExifTool:
+    """Long-lived `exiftool -stay_open` process, so Perl starts once per run instead of per file.
+    Started lazily; most files never reach the exiftool fallback."""
+
+    def __init__(self, timeout=EXIFTOOL_TIMEOUT):
+        self.proc = None
+        self.lines = None
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def _start(self):
+        self.proc = subprocess.Popen(["exiftool", "-stay_open", "True", "-@", "-"],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        # Reader thread so waiting for {ready} can time out (select() does not work on pipes on Windows)
+        self.lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self.proc.stdout, self.lines), daemon=True).start()
+
+    @staticmethod
+    def _pump(stdout, lines):
+        for line in iter(stdout.readline, b""): lines.put(line)
+        lines.put(None) # EOF
+
+    def _stop(self, kill):
+        if kill: self.proc.kill()
+        try: self.proc.wait(timeout=5)
+        except: pass
+        self.proc = None
+
+    def execute(self, *args):
+        with self.lock:
+            if not self.proc or self.proc.poll() is not None: self._start()
+            payload = "\n".join(("-charset", "filename=utf8", *args, "-execute")) + "\n"
+            try:
+                self.proc.stdin.write(payload.encode("utf-8"))
+                self.proc.stdin.flush()
+            except OSError:
+                self._stop(kill=True)
+                raise Exception("exiftool exited unexpectedly")
+
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    line = self.lines.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    # Hung on this file; restart on the next call instead of blocking everyone
+                    self._stop(kill=True)
+                    raise Exception("exiftool timed out")
+                if line is None:
+                    self._stop(kill=False)
+                    raise Exception("exiftool exited unexpectedly")
+                if line.strip() == b"{ready}": return
+
+    def close(self):
+        with self.lock:
+            if not self.proc: return
+            try:
+                self.proc.stdin.write(b"-stay_open\nFalse\n")
+                self.proc.stdin.close()
+                self.proc.wait(timeout=10)
+                self.proc = None
+            except:
+                self._stop(kill=True)
+
+EXIFTOOL = ExifTool()
+
 def set_exif_data(path, mem: Memory):
     """Applies timestamp and GPS metadata to the file."""
     if not path.exists(): return
@@ -144,7 +343,13 @@ def set_exif_data(path, mem: Memory):
     except: pass
 
     ts = mem.date.strftime("%Y:%m:%d %H:%M:%S")
-    cmd = ["exiftool", "-overwrite_original", "-q", "-ignoreMinorErrors"]
+
+    # In-process writers first; exiftool only as fallback (PNG, unusual containers)
+    try:
+        if write_image_dates(path, ts) if is_img(path) else write_video_dates(path, mem.date): return
+    except: pass
+
+    cmd = ["-overwrite_original", "-q", "-ignoreMinorErrors"]
     
     if is_img(path):
         cmd.extend([f"-DateTimeOriginal={ts}", f"-CreateDate={ts}", f"-ModifyDate={ts}"])
@@ -153,83 +358,205 @@ def set_exif_data(path, mem: Memory):
 
     cmd.append(str(path))
     try:
-        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
+        EXIFTOOL.execute(*cmd)
     except: pass 
 
 def sync_unzip(zip_path: Path, target_dir: Path):
-    main, overlay = None, None
+    """Extracts main/overlay in parallel. Each worker opens its own handle (independent offsets)."""
     with zipfile.ZipFile(zip_path, "r") as z:
-        for name in z.namelist():
-            if name.startswith("__MACOSX/"): continue
-            if "-main." in name: main = Path(z.extract(name, target_dir))
-            elif "-overlay." in name: overlay = Path(z.extract(name, target_dir))
+        names = [n for n in z.namelist() if not n.startswith("__MACOSX/")]
+    names = [n for n in names if "-main." in n or "-overlay." in n]
+    if not names: return None, None
+
+    def extract(name):
+        with zipfile.ZipFile(zip_path, "r") as z: return Path(z.extract(name, target_dir))
+
+    # zlib releases the GIL while inflating, so threads scale across cores
+    with ThreadPoolExecutor(max_workers=min(len(names), os.cpu_count() or 4)) as ex:
+        paths = list(ex.map(extract, names))
+
+    main, overlay = None, None
+    for name, path in zip(names, paths):
+        if "-main." in name: main = path
+        elif "-overlay." in name: overlay = path
     return main, overlay
 
+def build_merge_cmd(jobs, gpu):
+    """Builds one FFmpeg command merging every (main, overlay, out) job, one output per job.
+    GPU path keeps frames on the device end-to-end."""
+    inputs, graph, outputs = [], [], []
+    for k, (main, overlay, out) in enumerate(jobs):
+        m, o = 2 * k, 2 * k + 1
+        if gpu: inputs += ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda", "-i", str(main)]
+        else: inputs += ["-i", str(main)]
+        if is_img(overlay): inputs += ["-loop", "1", "-i", str(overlay)]
+        elif gpu: inputs += ["-hwaccel", "cuda", "-i", str(overlay)]
+        else: inputs += ["-i", str(overlay)]
+
+        if gpu:
+            # Decode into CUDA surfaces, composite with overlay_cuda, encode with NVENC (no host round-trip).
+            # NVDEC emits nv12, but overlay_cuda only takes yuva420p overlays on a yuv420p main
+            graph.append(f"[{o}:v]format=yuva420p,hwupload_cuda[o{k}];[{m}:v]scale_cuda=format=yuv420p[m{k}];"
+                         f"[m{k}][o{k}]overlay_cuda=shortest=1[v{k}]")
+            codec = ["-c:v", "h264_nvenc", "-preset", "p1"]
+        else:
+            graph.append(f"[{m}:v][{o}:v]overlay=eof_action=repeat:shortest=1[v{k}]")
+            codec = ["-c:v", "libx264", "-preset", "fast"] # CPU Default
+        outputs += ["-map", f"[v{k}]", "-map", f"{m}:a?", *codec, "-c:a", "copy", str(out)]
+
+    return ["ffmpeg", "-y", *inputs, "-filter_complex", ";".join(graph), *outputs]
+
+def run_merge_cmd(jobs, gpu):
+    cmd = build_merge_cmd(jobs, gpu)
+    res = subprocess.run(cmd, timeout=FFMPEG_TIMEOUT * len(jobs), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        lines = res.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise Exception(lines[-1] if lines else f"ffmpeg exited with code {res.returncode}")
+
 def sync_merge_videos(main, overlay, out):
     """Merges video with overlay using FFmpeg. Falls back to CPU if GPU fails."""
-    is_ovr_img = is_img(overlay)
-    
-    # Configure Hardware Acceleration
-    input_args = {}
-    output_args = {"vcodec": "libx264", "preset": "fast"} # CPU Default
-    
-    if USE_GPU:
-        input_args = {"hwaccel": "cuda"}
-        output_args = {"vcodec": "h264_nvenc", "preset": "p1"}
+    sync_merge_video_batch([(main, overlay, out)])
 
-    input_main = ffmpeg.input(str(main), **input_args)
-    if is_ovr_img: input_overlay = ffmpeg.input(str(overlay), loop=1)
-    else: input_overlay = ffmpeg.input(str(overlay), **input_args)
+def sync_merge_video_batch(jobs):
+    """Merges several clips in a single FFmpeg process. Falls back to CPU if GPU fails."""
+    global USE_GPU, GPU_FAIL_STREAK
+    gpu_error = None
+    if USE_GPU:
+        try:
+            # One GPU process at a time; each batch opens at most NVENC_SESSIONS encoders
+            with GPU_LOCK: run_merge_cmd(jobs, gpu=True)
+            with BAR_LOCK: GPU_FAIL_STREAK = 0
+            return
+        except Exception as e: gpu_error = e
 
     try:
-        final = input_main.overlay(input_overlay, shortest=1)
-        stream = ffmpeg.output(final, str(out), **output_args)
-        cmd = ffmpeg.compile(stream, overwrite_output=True)
-        subprocess.run(cmd, check=True, timeout=FFMPEG_TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        run_merge_cmd(jobs, gpu=False)
     except Exception as e:
         raise Exception(f"FFmpeg Merge Failed: {e}")
 
+    # CPU handled what the GPU could not. A single odd clip (e.g. a codec NVDEC can't decode)
+    # only costs this batch; only a streak of such batches means the GPU pipeline is broken
+    if gpu_error:
+        with BAR_LOCK:
+            if not USE_GPU: return
+            GPU_FAIL_STREAK += 1
+            if GPU_FAIL_STREAK < GPU_FAIL_LIMIT:
+                tqdm.write(f"⚠️ GPU merge failed ({gpu_error}). Used CPU for {len(jobs)} clip(s).")
+                return
+            USE_GPU = False
+            if VIDEO_BATCHER: VIDEO_BATCHER.size = MERGE_BATCH
+            tqdm.write(f"⚠️ GPU merge failed {GPU_FAIL_STREAK} times in a row ({gpu_error}). "
+                       "Using CPU (Software) for the rest of the run.")
+
+class VideoMergeBatcher:
+    """Collects pending video merges and runs them through one FFmpeg process per batch.
+    A batch is flushed when full or after `delay` seconds, whichever comes first."""
+
+    def __init__(self, size=MERGE_BATCH, delay=MERGE_BATCH_DELAY):
+        self.size = size
+        self.delay = delay
+        self.pending = []
+        self.timer = None
+        self.tasks = set() # Strong refs so running tasks aren't garbage-collected
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def submit(self, main, overlay, out):
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append(((main, overlay, out), fut))
+        if len(self.pending) >= self.size: self.flush()
+        elif not self.timer: self.timer = self._spawn(self._flush_later())
+        await fut
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.delay)
+        self.timer = None
+        self.flush()
+
+    def flush(self):
+        if self.timer: self.timer.cancel(); self.timer = None
+        batch, self.pending = self.pending, []
+        if batch: self._spawn(self._run(batch))
+
+    async def _run(self, batch):
+        jobs = [job for job, _ in batch]
+        try:
+            await asyncio.to_thread(sync_merge_video_batch, jobs)
+            for _, fut in batch:
+                if not fut.done(): fut.set_result(None)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done(): batch[0][1].set_exception(e)
+                return
+
+        # One bad clip fails the whole process; retry individually so the rest still succeed
+        for job, fut in batch:
+            try:
+                await asyncio.to_thread(sync_merge_videos, *job)
+                if not fut.done(): fut.set_result(None)
+            except Exception as e:
+                if not fut.done(): fut.set_exception(e)
+
 def sync_merge_images(main, overlay, out):
     verify_file_integrity(main)
     verify_file_integrity(overlay)
-    base = Image.open(main).convert("RGBA")
-    top = Image.open(overlay).convert("RGBA")
-    if top.size != base.size:
-        top = top.resize(base.size, Image.Resampling.LANCZOS)
-    base.paste(top, (0, 0), top)
-    base.convert("RGB").save(out, "JPEG")
+    with Image.open(main) as im: base = np.asarray(im.convert("RGB"))
+    with Image.open(overlay) as im: top = np.asarray(im.convert("RGBA"))
+    h, w = base.shape[:2]
+    if top.shape[:2] != (h, w):
+        # INTER_AREA for downscale, INTER_LINEAR for upscale; LANCZOS is wasted on overlays
+        interp = cv2.INTER_AREA if top.shape[1] > w else cv2.INTER_LINEAR
+        top = cv2.resize(top, (w, h), interpolation=interp)
+
+    # Vectorized alpha blend: out = base + (top - base) * alpha
+    alpha = top[..., 3:4].astype(np.float32) * (1 / 255)
+    blend = np.empty(base.shape, dtype=np.float32)
+    np.subtract(top[..., :3], base, out=blend, dtype=np.float32)
+    blend *= alpha
+    blend += base
+    merged = np.empty_like(base)
+    np.rint(blend, out=blend)
+    np.copyto(merged, blend, casting="unsafe")
+
+    if TURBO_JPEG:
+        data = TURBO_JPEG.encode(merged, quality=92, pixel_format=TJPF_RGB, jpeg_subsample=TJSAMP_420)
+    else:
+        ok, buf = cv2.imencode(".jpg", merged[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, 92])
+        if not ok: raise Exception("JPEG Encode Failed")
+        data = buf.tobytes()
+    safe_write(Path(out), data)
 
 # ======================================================
 # CORE LOGIC
 # ======================================================
 
-async def fetch_binary(client, url):
+async def fetch_binary(client, url, dest):
+    """Streams the response body straight into `dest`.
+    Returns the first bytes of the payload (for type sniffing), or b"" if nothing was saved."""
     try:
-        r = await client.get(url, timeout=45)
-        return r.content if r.status_code == 200 else None
-    except: return None
+        async with client.stream("GET", url, timeout=45) as r:
+            if r.status_code != 200: return b""
+            head = b""
+            async with await anyio.open_file(dest, "wb") as f:
+                async for chunk in r.aiter_bytes(DOWNLOAD_CHUNK):
+                    if len(head) < 4: head += chunk[:4 - len(head)]
+                    await f.write(chunk)
+            return head
+    except: return b""
 
 async def process_memory(client, mem, outdir, add_exif, specific_bar, total_bar, force_backup_link=False):
     if not mem.media_url and not mem.download_link: return
     name = mem.filename
     temp_path = outdir / f"{name}_TEMP"
-    zip_path = outdir / f"{name}.zip"
     extract_dir = outdir / f"{name}_zip"
     
     # === FILE EXISTENCE CHECK (Zero-Trust) ===
-    # Mode 3: Only check for MAIN.
-    # Mode 1/2: Check for MERGED first, then MAIN.
-    
-    possible_files = []
-    if PROCESSING_MODE == 3:
-        possible_files = [outdir / f"{name}_MAIN.mp4", outdir / f"{name}_MAIN.jpg", outdir / f"{name}_MAIN.png"]
-    else:
-        possible_files = [
-            outdir / f"{name}_MERGED.mp4", outdir / f"{name}_MERGED.jpg",
-            outdir / f"{name}_MAIN.mp4", outdir / f"{name}_MAIN.jpg", outdir / f"{name}_MAIN.png"
-        ]
-    
-    for f in possible_files:
+    for f in mem.candidate_paths(outdir, PROCESSING_MODE):
         if f.exists():
             if f.stat().st_size == 0:
                 f.unlink(missing_ok=True); continue
@@ -246,29 +573,26 @@ async def process_memory(client, mem, outdir, add_exif, specific_bar, total_bar,
         try:
             async with DOWNLOAD_SEM:
                 links = [mem.media_url, mem.download_link] if not force_backup_link else [mem.download_link, mem.media_url]
-                data = None
+                head = b""
                 for link in links:
                     if link:
-                        data = await fetch_binary(client, link)
-                        if data: break
+                        head = await fetch_binary(client, link, temp_path)
+                        if head: break
                 
-                if not data: raise Exception("All download links failed")
-                await asyncio.to_thread(safe_write, temp_path, data)
-
-            is_zip = zipfile.is_zipfile(temp_path)
+                if not head: raise Exception("All download links failed")
 
-            if is_zip:
-                temp_path.rename(zip_path)
+            if is_zip(temp_path, head):
+                # Extract straight from the downloaded file; no rename to .zip needed
                 extract_dir.mkdir(exist_ok=True)
-                main, overlay = await asyncio.to_thread(sync_unzip, zip_path, extract_dir)
+                main, overlay = await asyncio.to_thread(sync_unzip, temp_path, extract_dir)
                 
                 if not main: raise Exception("Empty Zip Archive")
                 
                 final_main = outdir / f"{name}_MAIN{main.suffix}"
                 merged_out = outdir / f"{name}_MERGED{main.suffix}"
 
-                # Save Main File
-                await asyncio.to_thread(safe_write, final_main, main.read_bytes())
+                # Save Main File (move, not copy; extract_dir is discarded anyway)
+                await asyncio.to_thread(main.replace, final_main)
                 if add_exif: await asyncio.to_thread(set_exif_data, final_main, mem)
 
                 # Processing Logic based on Mode
@@ -280,7 +604,7 @@ async def process_memory(client, mem, outdir, add_exif, specific_bar, total_bar,
                     if is_img(main) and is_img(overlay):
                         await asyncio.to_thread(sync_merge_images, final_main, overlay, merged_out)
                     else:
-                        await asyncio.to_thread(sync_merge_videos, final_main, overlay, merged_out)
+                        await VIDEO_BATCHER.submit(final_main, overlay, merged_out)
                     
                     if add_exif: await asyncio.to_thread(set_exif_data, merged_out, mem)
 
@@ -310,7 +634,6 @@ async def process_memory(client, mem, outdir, add_exif, specific_bar, total_bar,
             # Cleanup
             shutil.rmtree(extract_dir, ignore_errors=True)
             temp_path.unlink(missing_ok=True)
-            zip_path.unlink(missing_ok=True)
 
     if specific_bar: specific_bar.update(1)
     if total_bar: total_bar.update(1)
@@ -319,60 +642,59 @@ async def process_memory(client, mem, outdir, add_exif, specific_bar, total_bar,
 # EXECUTION
 # ======================================================
 
-async def run_batch(memories, outdir, add_exif, desc, n_workers, force_backup_link=False):
+async def run_batch(client, memories, outdir, add_exif, desc, n_workers, force_backup_link=False):
     global ERROR_COUNT
     ERROR_COUNT = 0
     
-    img_queue = asyncio.Queue()
-    vid_queue = asyncio.Queue()
-    
-    for m in memories:
-        (img_queue if m.media_type == "Image" else vid_queue).put_nowait(m)
+    # Single queue shared by every worker; videos (costlier) first so none straggle at the end
+    work_queue = asyncio.PriorityQueue()
+    n_img = 0
+    for i, m in enumerate(memories):
+        is_vid = m.media_type != "Image"
+        n_img += not is_vid
+        work_queue.put_nowait((-VIDEO_COST if is_vid else -IMAGE_COST, i, m))
 
     print(f"\n🔹 {desc} | {len(memories)} items | Threads: {n_workers}")
     pbar_total = tqdm(total=len(memories), position=0, desc="TOTAL", bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{postfix}]")
-    pbar_img = tqdm(total=img_queue.qsize(), position=1, desc="📸 IMG ", bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}")
-    pbar_vid = tqdm(total=vid_queue.qsize(), position=2, desc="🎥 VID ", bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}")
+    pbar_img = tqdm(total=n_img, position=1, desc="📸 IMG ", bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}")
+    pbar_vid = tqdm(total=len(memories) - n_img, position=2, desc="🎥 VID ", bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt}")
     pbar_total.set_postfix(errors=0)
 
-    async def worker(q, bar):
-        async with httpx.AsyncClient(headers=HEADERS, timeout=60, follow_redirects=True) as client:
-            while not q.empty():
-                try:
-                    mem = await q.get()
-                    await process_memory(client, mem, outdir, add_exif, bar, pbar_total, force_backup_link)
-                finally: q.task_done()
-
-    tasks = []
-    # Interleaved Launch
-    for _ in range(n_workers):
-        tasks.append(asyncio.create_task(worker(vid_queue, pbar_vid)))
-        tasks.append(asyncio.create_task(worker(img_queue, pbar_img)))
-        tasks.append(asyncio.create_task(worker(img_queue, pbar_img)))
-
-    await asyncio.gather(img_queue.join(), vid_queue.join())
+    async def worker():
+        # All workers share one client so connections (and their TLS handshakes) are reused
+        while not work_queue.empty():
+            try:
+                _, _, mem = await work_queue.get()
+                bar = pbar_img if mem.media_type == "Image" else pbar_vid
+                await process_memory(client, mem, outdir, add_exif, bar, pbar_total, force_backup_link)
+            finally: work_queue.task_done()
+
+    # Same worker count as the former 1 video + 2 image workers per slot
+    tasks = [asyncio.create_task(worker()) for _ in range(n_workers * 3)]
+
+    await work_queue.join()
     for t in tasks: t.cancel()
     pbar_vid.close(); pbar_img.close(); pbar_total.close()
 
+def stat_sizes(entries):
+    return {e.name: e.stat(follow_symlinks=False).st_size for e in entries}
+
 def scan_for_issues(all_memories, outdir, delete_bad=True):
     missing_or_bad = []
+    # One directory listing instead of several stat calls per memory
+    with os.scandir(outdir) as it:
+        entries = [e for e in it if e.is_file(follow_symlinks=False)]
+
+    # stat releases the GIL; hand each thread a slice so per-task overhead stays small
+    existing = {}
+    step = max(1, -(-len(entries) // SCAN_WORKERS))
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as ex:
+        for sizes in ex.map(stat_sizes, (entries[i:i + step] for i in range(0, len(entries), step))):
+            existing.update(sizes)
+
     for mem in tqdm(all_memories, desc="🔎 Verifying Files", unit="file"):
-        base_name = mem.filename
-        
-        # Check based on mode preference logic
-        candidates = []
-        if PROCESSING_MODE == 3:
-            candidates = [f"{base_name}_MAIN.mp4", f"{base_name}_MAIN.jpg", f"{base_name}_MAIN.png"]
-        else:
-            candidates = [f"{base_name}_MERGED.mp4", f"{base_name}_MERGED.jpg",
-                          f"{base_name}_MAIN.mp4", f"{base_name}_MAIN.jpg", f"{base_name}_MAIN.png"]
-        
-        valid = False
-        for c in candidates:
-            fpath = outdir / c
-            if fpath.exists() and fpath.stat().st_size > 0:
-                valid = True; break
-                
+        # Check based on mode preference logic (dict lookups only, so no thread pool needed here)
+        valid = any(existing.get(c, 0) > 0 for c in mem.candidate_names(PROCESSING_MODE))
         if not valid: missing_or_bad.append(mem)
     return missing_or_bad
 
@@ -398,6 +720,7 @@ async def main():
     global USE_GPU
     global DOWNLOAD_SEM
     global PROCESSING_MODE
+    global VIDEO_BATCHER
     
     # Interactive Menu
     PROCESSING_MODE = get_user_mode()
@@ -425,6 +748,7 @@ async def main():
         print(f"⚙️ Manual Config: Using {workers_val} workers.")
 
     DOWNLOAD_SEM = asyncio.Semaphore(workers_val + 20)
+    VIDEO_BATCHER = VideoMergeBatcher(size=NVENC_SESSIONS if USE_GPU else MERGE_BATCH)
     
     print("\n🚀 CONFIGURATION:")
     print(f"   Mode:    {['Unknown', 'Keep Both', 'Optimized', 'Raw Only'][PROCESSING_MODE]}")
@@ -432,24 +756,38 @@ async def main():
     print(f"   Workers: {workers_val}")
 
     try:
-        raw = json.load(open(args.json_file, "r", encoding="utf-8"))
-        all_memories = [Memory(**m) for m in raw["Saved Media"]]
+        raw = orjson.loads(Path(args.json_file).read_bytes())
+        all_memories = [Memory.model_validate(m) for m in raw["Saved Media"]]
     except Exception as e:
         print(f"❌ Error loading JSON: {e}"); return
 
-    # Execution Phases
-    await run_batch(all_memories, outdir, not args.no_exif, "Phase 1: Main Download", workers_val)
-    
-    print("\n🔎 Validating Downloads...")
-    bad_memories = await asyncio.to_thread(scan_for_issues, all_memories, outdir)
-    
-    if bad_memories:
-        print(f"⚠️ {len(bad_memories)} files missing/corrupt. Retrying...")
-        await run_batch(bad_memories, outdir, not args.no_exif, "Phase 2: Repair Run", workers_val, force_backup_link=True)
+    load_failure_log()
+
+    # Shared Connection Pool
+    limits = httpx.Limits(max_connections=workers_val * 4, max_keepalive_connections=workers_val * 2)
+
+    async with httpx.AsyncClient(headers=HEADERS, timeout=60, follow_redirects=True, http2=True, limits=limits) as client:
+        # Execution Phases
+        await run_batch(client, all_memories, outdir, not args.no_exif, "Phase 1: Main Download", workers_val)
+        
+        print("\n🔎 Validating Downloads...")
+        bad_memories = await asyncio.to_thread(scan_for_issues, all_memories, outdir)
+        
+        if bad_memories:
+            print(f"⚠️ {len(bad_memories)} files missing/corrupt. Retrying...")
+            await run_batch(client, bad_memories, outdir, not args.no_exif, "Phase 2: Repair Run", workers_val, force_backup_link=True)
     
+    EXIFTOOL.close()
+    compact_failure_log()
     print("\n✅ Operation Complete.")
 
 if __name__ == "__main__":
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    else:
+        # libuv-backed loop; optional, falls back to the default loop
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError: pass
     asyncio.run(main())
\ No newline at end of file